@@ -2,9 +2,9 @@ import keyword
 import os
 import re
 from datetime import date, datetime
-from inspect import getmodule
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Set, Tuple, Type, Union, List
+from typing import Any, Dict, Optional, Set, Tuple, Type, Union, List
 
 from uuid import UUID
 
@@ -20,47 +20,146 @@ TYPE_PREFERENCE_ORDER = [str,
                          int,
                          date,
                          datetime]
-
-
-def is_date(value: Union[date, StrBytesIntFloat]) -> bool:
+_TYPE_RANK = {_type: rank for rank, _type in enumerate(TYPE_PREFERENCE_ORDER)}
+_DEFAULT_RANK = len(TYPE_PREFERENCE_ORDER) + 1
+
+# Long lists of scalars are only sampled: the first and last elements, stopping once the types stop changing
+_LIST_SAMPLE_SIZE = 32
+_LIST_STABLE_ITERATIONS = 8
+
+# Enum detection only looks at the first string values offered for a property
+_ENUM_SAMPLE_SIZE = 40
+
+# Number of distinct date/datetime/uuid candidate strings whose classification is remembered
+_STRING_TYPE_CACHE_SIZE = 1024
+
+# Cheap pre-filters so the pydantic/uuid parsers (and their exceptions) only run on plausible strings
+_DATE_RE = re.compile(r"^\d{4}-\d{1,2}-\d{1,2}$")
+_DT_RE = re.compile(r"^\d{4}-\d{1,2}-\d{1,2}[T ]\d{1,2}:")
+# Numeric strings (digits with at most one "-") are treated as plain strings, never as hex UUIDs
+_UUID_RE = re.compile(r"^(?!\d*-?\d*$)(?:urn:uuid:)?\{?[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}\}?$", re.IGNORECASE)
+
+# Module to import each emitted type from, anything else falls back to the type's own __module__
+_TYPE_IMPORT = {str: "builtins",
+                int: "builtins",
+                float: "builtins",
+                bool: "builtins",
+                type(None): "builtins",
+                datetime: "datetime",
+                date: "datetime",
+                UUID: "uuid",
+                Any: "typing"}
+
+# Templates for the generated module, each line carries its leading newline so they concatenate after the imports
+_CLASS_TEMPLATE = "\n\n\nclass %s(BaseModel):"
+_FIELD_TEMPLATE = "\n    %s: %s"
+_ALIASED_FIELD_TEMPLATE = "\n    %s: %s = Field(%s, alias=\"%s\")"
+
+# Characters that are not valid in an identifier, or a leading digit
+_IDENT_SUB = re.compile(r"\W|^(?=\d)").sub
+_KEYWORDS = frozenset(keyword.kwlist)
+
+
+def _get_type_rank(_type: Any) -> int:
+    # Nested models are never in the preference order
+    if isinstance(_type, Model):
+        return _DEFAULT_RANK
+    return _TYPE_RANK.get(_type, _DEFAULT_RANK)
+
+
+def _resolve_type(old_type: Any, new_type: Any) -> Any:
+    # None means no type has been observed yet, otherwise the preferred type wins and the newer one wins ties
+    if old_type is None:
+        return new_type
+    if new_type is None:
+        return old_type
+    return new_type if _get_type_rank(new_type) <= _get_type_rank(old_type) else old_type
+
+
+def _try_parse_date(value: str) -> bool:
     try:
         parse_date(value)
-        return isinstance(value, (str, date))
+        return True
     except:
         return False
 
 
-def is_datetime(value: Union[datetime, StrBytesIntFloat]) -> bool:
+def _try_parse_datetime(value: str) -> bool:
     try:
         parse_datetime(value)
-        return isinstance(value, (str, datetime))
+        return True
     except:
         return False
 
 
+def _try_parse_uuid(value: str) -> bool:
+    try:
+        UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+def is_date(value: Union[date, StrBytesIntFloat]) -> bool:
+    if isinstance(value, date):
+        return True
+    return bool(isinstance(value, str) and _DATE_RE.match(value)) and _try_parse_date(value)
+
+
+def is_datetime(value: Union[datetime, StrBytesIntFloat]) -> bool:
+    if isinstance(value, datetime):
+        return True
+    return bool(isinstance(value, str) and _DT_RE.match(value)) and _try_parse_datetime(value)
+
+
 def is_uuid(value) -> bool:
     if isinstance(value, UUID):
         return True
-    try:
-        if isinstance(value, str):
-            UUID(value)
-            return True
-    except ValueError:
-        pass
-    return False
+    return bool(isinstance(value, str) and _UUID_RE.match(value)) and _try_parse_uuid(value)
+
+
+@lru_cache(maxsize=_STRING_TYPE_CACHE_SIZE)
+def _get_string_type(value: str) -> type:
+    # Bounded, so repeated candidates (ids, timestamps) are parsed once without keeping every value alive
+    if is_datetime(value):
+        return datetime
+    if is_date(value):
+        return date
+    if is_uuid(value):
+        return UUID
+    return str
+
+
+class ModelProperty(object):
+    __slots__ = ("type", "number_of_times_seen", "observed_values", "number_of_values_sampled", "is_list")
+
+    def __init__(self, type: Any = None, number_of_times_seen: int = 0, observed_values: Set[Any] = None,
+                 number_of_values_sampled: int = 0, is_list: bool = False):
+        self.type: Any = type
+        self.number_of_times_seen: int = number_of_times_seen
+        self.observed_values: Set[Any] = set() if observed_values is None else observed_values
+        # How many values were offered to observed_values, the denominator of the enum ratio
+        self.number_of_values_sampled: int = number_of_values_sampled
+        self.is_list: bool = is_list
 
+    def __repr__(self) -> str:
+        return "ModelProperty(type={type!r}, number_of_times_seen={number_of_times_seen}, is_list={is_list})".format(type=self.type,
+                                                                                                                    number_of_times_seen=self.number_of_times_seen,
+                                                                                                                    is_list=self.is_list)
 
-class ModelProperty(BaseModel):
-    number_of_times_seen: int = 0
-    observed_values: Set[Any] = set()
-    type: Any
-    is_list: bool = False
 
+class Model(object):
+    __slots__ = ("name", "number_of_times_seen", "keys", "child_model_names")
 
-class Model(BaseModel):
-    number_of_times_seen: int = 0
-    keys: Dict[str, ModelProperty] = {}
-    name: str
+    def __init__(self, name: str, number_of_times_seen: int = 0, keys: Dict[str, ModelProperty] = None,
+                 child_model_names: List[str] = None):
+        self.name: str = name
+        self.number_of_times_seen: int = number_of_times_seen
+        self.keys: Dict[str, ModelProperty] = {} if keys is None else keys
+        self.child_model_names: List[str] = [] if child_model_names is None else child_model_names
+
+    def __repr__(self) -> str:
+        return "Model(name={name!r})".format(name=self.name)
 
 
 class JsonToModelParser(object):
@@ -68,89 +167,159 @@ class JsonToModelParser(object):
     def __init__(self, root_name: str = "Root"):
         self.root_name: str = root_name
         self.models: Dict[str, Model] = {}
+        self._singular_cache: Dict[str, str] = {}
+        self._norm_cache: Dict[str, str] = {}
+        # Bumped by every parse_dict call so the cached dependency order is rebuilt after new input
+        self._models_version: int = 0
+        self._dep_order_cache: Optional[List[str]] = None
+        self._dep_order_cache_key: Optional[Tuple[int, str]] = None
 
     def _get_type(self, name: str, value: Any) -> type:
         if isinstance(value, dict):
-            _type = self.parse_dict(value, name=name)
-        else:
-            if str(value).replace(".", "", 1).replace("-", "", 1).isdigit():
-                _type = type(value)
-            elif is_datetime(value):
-                _type = datetime
-            elif is_date(value):
-                _type = date
-            elif is_uuid(value):
-                _type = UUID
-            else:
-                _type = type(value)
-        return _type
+            return self.parse_dict(value, name=name)
+        return self._get_scalar_type(value)
+
+    def _get_scalar_type(self, value: Any) -> type:
+        # JSON already types everything except strings, so only strings need to be inspected
+        if value is None:
+            return type(None)
+        if not isinstance(value, str):
+            return type(value)
+
+        # Strings that fail every pre-filter are plain strings, only the candidates go through the parsers
+        if _DT_RE.match(value) or _DATE_RE.match(value) or _UUID_RE.match(value):
+            return _get_string_type(value)
+        return str
 
     def _get_dependencies_order(self, model: Model) -> List[str]:
+        cache_key = (self._models_version, model.name)
+        if self._dep_order_cache_key == cache_key:
+            return self._dep_order_cache
+
+        # Iterative post-order DFS so each model is emitted once, after everything it references
         dependencies = []
-        for key, property in model.keys.items():
-            if isinstance(property.type, Model):
-                dependencies.extend(self._get_dependencies_order(self.models.get(property.type.name)))
-        dependencies.append(model.name)
+        visited: Set[str] = set()
+        stack: List[Tuple[Model, bool]] = [(model, False)]
+        while stack:
+            current, processed = stack.pop()
+            if processed:
+                dependencies.append(current.name)
+                continue
+            if current.name in visited:
+                continue
+            visited.add(current.name)
+            stack.append((current, True))
+            # Pushed in reverse so children are visited in the order they were found
+            for child_model_name in reversed(current.child_model_names):
+                stack.append((self.models.get(child_model_name), False))
+
+        self._dep_order_cache = dependencies
+        self._dep_order_cache_key = cache_key
         return dependencies
 
     def _normalize_key(self, key: str) -> str:
-        return key.replace("_", " ").replace("-", " ").title().replace(" ", "")
+        normalized_key = self._norm_cache.get(key)
+        if normalized_key is None:
+            normalized_key = key.replace("_", " ").replace("-", " ").title().replace(" ", "")
+            self._norm_cache[key] = normalized_key
+        return normalized_key
+
+    def _singularize_key(self, key: str) -> str:
+        singular_key = self._singular_cache.get(key)
+        if singular_key is None:
+            # singular_noun returns False for words that are already singular
+            singular_key = inflection_engine.singular_noun(key) or key
+            self._singular_cache[key] = singular_key
+        return singular_key
 
     def parse_dict(self, model_dict: dict, name: str = None) -> Model:
         if name is None:
             name = self.root_name
-        _model = self.models.get(name, Model(name=name))
+        self._models_version += 1
+        _model = self.models.get(name)
+        if _model is None:
+            _model = Model(name=name)
+            self.models[name] = _model
         _model.number_of_times_seen += 1
         for key, value in model_dict.items():
             is_list = False
             if isinstance(value, list):
                 is_list = True
-                if inflection_engine.singular_noun(key):
-                    singular_key = inflection_engine.singular_noun(key)
-                else:
-                    singular_key = key
-                singular_key = self._normalize_key(singular_key)
-                if len(value) > 0:
+                singular_key = self._normalize_key(self._singularize_key(key))
+                # Lists are assumed to be homogeneous, so the first non-null element decides how the list is walked
+                first_value = next((_value for _value in value if _value is not None), None)
+                _type = None
+                if isinstance(first_value, dict):
+                    # Every element is walked so nested models discover all of their keys
                     for _value in value:
-                        _type = self._get_type(name + singular_key, _value)
-                else:
-                    _type = None
+                        if isinstance(_value, dict):
+                            _type = _resolve_type(_type, self.parse_dict(_value, name=name + singular_key))
+                        elif _value is not None:
+                            _type = _resolve_type(_type, self._get_scalar_type(_value))
+                elif first_value is not None:
+                    # Short lists are classified completely, long ones are sampled and may stop early
+                    is_sampled = len(value) > _LIST_SAMPLE_SIZE
+                    if is_sampled:
+                        sample = value[:_LIST_SAMPLE_SIZE // 2] + value[-(_LIST_SAMPLE_SIZE // 2):]
+                    else:
+                        sample = value
+                    seen_types: Set[type] = set()
+                    stable_iterations = 0
+                    for _value in sample:
+                        # Nulls say nothing about the element type, so they do not count towards stability either
+                        if _value is None:
+                            continue
+                        # A stray object in a scalar list still becomes a nested model
+                        if isinstance(_value, dict):
+                            _type = _resolve_type(_type, self.parse_dict(_value, name=name + singular_key))
+                            stable_iterations = 0
+                            continue
+                        element_type = self._get_scalar_type(_value)
+                        if element_type in seen_types:
+                            stable_iterations += 1
+                            if is_sampled and stable_iterations >= _LIST_STABLE_ITERATIONS:
+                                # Still look at the last element, so a trailing change of type (or object) is not missed
+                                if value[-1] is not None:
+                                    _type = _resolve_type(_type, self._get_type(name + singular_key, value[-1]))
+                                break
+                        else:
+                            seen_types.add(element_type)
+                            stable_iterations = 0
+                            _type = _resolve_type(_type, element_type)
             else:
                 _type = self._get_type(name + self._normalize_key(key), value)
 
-            model_property = _model.keys.get(key, ModelProperty(type=_type))
+            model_property = _model.keys.get(key)
+            if model_property is None:
+                model_property = ModelProperty(type=_type)
+                _model.keys[key] = model_property
+                previous_type = None
+            else:
+                previous_type = model_property.type
 
             if value is not None:
                 model_property.number_of_times_seen += 1
             model_property.is_list = is_list
-            _model.keys[key] = model_property
-            try:
-                model_property.observed_values.add(value)
-            except TypeError:
-                # Error on non hashable types, we don't care
-                pass
 
             if model_property.type is not _type and model_property.type != _type:
                 print("Mismatch: Property '{name}' was type '{old_type}' but was now found to be '{new_type}'".format(name=key,
                                                                                                                       old_type=model_property.type,
                                                                                                                       new_type=_type))
-                if model_property.type is None:
-                    model_property.type = _type
-                elif _type is not None:
-                    if _type in TYPE_PREFERENCE_ORDER:
-                        new_type_preference = TYPE_PREFERENCE_ORDER.index(_type)
-                    else:
-                        new_type_preference = len(TYPE_PREFERENCE_ORDER) + 1
+                model_property.type = _resolve_type(model_property.type, _type)
+                print("Resolved type to value '{new_type}'".format(new_type=model_property.type))
 
-                    if model_property.type in TYPE_PREFERENCE_ORDER:
-                        old_type_preference = TYPE_PREFERENCE_ORDER.index(model_property.type)
-                    else:
-                        old_type_preference = len(TYPE_PREFERENCE_ORDER) + 1
+            # Nested model references follow the resolved type, so a model displaced by another type is not emitted
+            if model_property.type is not previous_type:
+                if isinstance(previous_type, Model) and all(_property.type is not previous_type for _property in _model.keys.values()):
+                    _model.child_model_names.remove(previous_type.name)
+                if isinstance(model_property.type, Model) and model_property.type.name not in _model.child_model_names:
+                    _model.child_model_names.append(model_property.type.name)
 
-                    model_property.type = _type if new_type_preference <= old_type_preference else model_property.type
-                print("Resolved type to value '{new_type}'".format(new_type=model_property.type))
+            # Only string values can make up an enum, and only a sample of the first ones is kept
+            if model_property.number_of_values_sampled < _ENUM_SAMPLE_SIZE and isinstance(value, str):
+                model_property.number_of_values_sampled += 1
+                model_property.observed_values.add(value)
 
-        self.models[name] = _model
         return _model
 
     def generate_models(self) -> Dict[str, Type[BaseModel]]:
@@ -173,16 +342,17 @@ class JsonToModelParser(object):
         return generated_models
 
     def is_enum(self, property: ModelProperty) -> bool:
-        if property.number_of_times_seen > 20 and property.type == str and float(len(property.observed_values)) / float(property.number_of_times_seen) < .5:
+        sample_size = property.number_of_values_sampled
+        if sample_size > 20 and property.type == str and float(len(property.observed_values)) / float(sample_size) < .5:
             return True
         return False
 
     def output_models_to_package(self, package: str, module_name: str) -> None:
         dependencies = {"from pydantic import BaseModel, Field", "from typing import Optional"}
-        class_string = []
+        class_string: List[str] = []
         for model_name in self._get_dependencies_order(self.models.get(self.root_name)):
             model = self.models.get(model_name)
-            class_string.append("\n\nclass {model_name}(BaseModel):".format(model_name=model_name))
+            class_string.append(_CLASS_TEMPLATE % model_name)
             for key, value in model.keys.items():
                 if value.number_of_times_seen == model.number_of_times_seen:
                     optional = False
@@ -196,35 +366,30 @@ class JsonToModelParser(object):
                         value.type = Any
                     else:
                         if self.is_enum(value):
-                            print("{key} IS AN ENUM: {values}".format(key=key, values=value.observed_values))
+                            print(f"{key} IS AN ENUM: {value.observed_values}")
                         type = str(value.type.__name__)
-                    module = getmodule(value.type).__name__
+                    module = _TYPE_IMPORT.get(value.type) or value.type.__module__
                     if module != "builtins":
-                        dependencies.add("from {module} import {type}".format(module=module, type=type))
+                        dependencies.add(f"from {module} import {type}")
 
                 if value.is_list:
                     dependencies.add("from typing import List")
-                    type = "List[{type}]".format(type=type)
+                    type = f"List[{type}]"
 
                 if optional:
-                    type = "Optional[{type}]".format(type=type)
+                    type = f"Optional[{type}]"
 
-                if not key.isidentifier() or keyword.iskeyword(key):
-                    cleaned_key = re.sub('\W|^(?=\d)', '_', key)
-                    if keyword.iskeyword(cleaned_key):
+                if not key.isidentifier() or key in _KEYWORDS:
+                    cleaned_key = _IDENT_SUB("_", key)
+                    if cleaned_key in _KEYWORDS:
                         cleaned_key = cleaned_key + "_"
                     default_value = "None" if optional else "..."
-                    class_string.append("    {cleaned_key}: {type} = Field({default_value}, alias=\"{key}\")".format(key=key,
-                                                                                                                     type=type,
-                                                                                                                     default_value=default_value,
-                                                                                                                     cleaned_key=cleaned_key))
+                    class_string.append(_ALIASED_FIELD_TEMPLATE % (cleaned_key, type, default_value, key))
                 else:
-                    class_string.append("    {key}: {type}".format(key=key, type=type))
+                    class_string.append(_FIELD_TEMPLATE % (key, type))
         directory = os.path.join(*package.split("."))
-        file = os.path.join(directory, "{module_name}.py".format(module_name=module_name))
+        file = os.path.join(directory, f"{module_name}.py")
         Path(directory).mkdir(parents=True, exist_ok=True)
 
         with open(file, "w") as file:
-            file.write("\n".join(dependencies))
-            file.write("\n")
-            file.write("\n".join(class_string))
\ No newline at end of file
+            file.write("\n".join(dependencies) + "".join(class_string))